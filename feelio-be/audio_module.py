@@ -2,26 +2,113 @@
 Audio module for Feelio - handles speech recognition and text-to-speech.
 """
 
+import base64
+import hashlib
+import io
+import json
 import logging
+import re
+import threading
 import time
-from typing import Optional
-import speech_recognition as sr
-from gtts import gTTS
-import pygame
-import os
+from collections import OrderedDict
+from functools import lru_cache
+from typing import TYPE_CHECKING, Iterator, Optional, Tuple
+import requests
+from requests.adapters import HTTPAdapter
+
+# speech_recognition, gTTS and miniaudio are imported where they're first used,
+# so a server that never listens or speaks doesn't pay for loading them.
+if TYPE_CHECKING:
+    import miniaudio
+    import speech_recognition as sr
 
 logger = logging.getLogger(__name__)
 
+_TTS_AUDIO_RE = re.compile(r'jQ1olc","\[\\"(.*)\\"]')
+
+
+@lru_cache(maxsize=None)
+def _pooled_tts_class():
+    """Build (once) the gTTS subclass that sends requests through a shared session."""
+    from gtts import gTTS, gTTSError
+
+    class _PooledTTS(gTTS):
+        """
+        gTTS that sends its requests through a shared keep-alive session.
+
+        Stock gTTS opens a fresh requests.Session per request, paying a TCP + TLS
+        handshake on every utterance.
+        """
+
+        def __init__(self, *args, session: requests.Session, **kwargs):
+            super().__init__(*args, **kwargs)
+            self._session = session
+
+        def stream(self) -> Iterator[bytes]:
+            """Yield mp3 chunks, mirroring gTTS.stream() but reusing the session."""
+            if not hasattr(self, "_prepare_requests"):
+                # Unknown gTTS internals; fall back to the stock implementation
+                yield from super().stream()
+                return
+
+            for prepared in self._prepare_requests():
+                try:
+                    r = self._session.send(prepared, timeout=getattr(self, "timeout", None))
+                    r.raise_for_status()
+                except requests.exceptions.HTTPError as e:
+                    raise gTTSError(tts=self, response=r) from e
+                except requests.exceptions.RequestException as e:
+                    raise gTTSError(tts=self) from e
+
+                for line in r.iter_lines(chunk_size=1024):
+                    decoded = line.decode("utf-8")
+                    if "jQ1olc" not in decoded:
+                        continue
+                    match = _TTS_AUDIO_RE.search(decoded)
+                    if not match:
+                        raise gTTSError(tts=self, response=r)
+                    yield base64.b64decode(match.group(1).encode("ascii"))
+
+    return _PooledTTS
+
+
+def _stream_until_done(sample_stream, done: threading.Event):
+    """
+    Forward a miniaudio sample stream, setting `done` however it ends.
+
+    miniaudio's own end_callback only fires when decoding finishes cleanly;
+    this also covers a decoder that raises and a stream the device drops.
+    """
+    try:
+        frame_count = yield b""
+        while True:
+            frame_count = yield sample_stream.send(frame_count)
+    except StopIteration:
+        pass
+    finally:
+        done.set()
+
 
 class AudioManager:
     """Manages microphone input and speaker output."""
 
+    # Re-measure ambient noise every N turns to follow a drifting room
+    _RECALIBRATE_EVERY = 20
+
+    # Max number of synthesized utterances kept in memory
+    _TTS_CACHE_MAX = 64
+
+    # Extra seconds to wait past a track's length before giving up on playback
+    _PLAYBACK_GRACE = 2.0
+
     def __init__(
         self,
         microphone_index: int = 0,
         speech_timeout: int = 5,
         phrase_time_limit: int = 10,
         ambient_noise_duration: int = 1,
+        vosk_model_path: Optional[str] = None,
+        enable_playback: bool = True,
     ):
         """
         Initialize audio manager.
@@ -31,39 +118,80 @@ class AudioManager:
             speech_timeout: Timeout for listening in seconds.
             phrase_time_limit: Maximum time to listen for speech in seconds.
             ambient_noise_duration: Time to adjust for ambient noise in seconds.
+            vosk_model_path: Path to a local Vosk model. When set, speech is
+                transcribed on-device while the user talks, with Google as fallback.
+            enable_playback: If False, speak_response is a no-op. For the API
+                server, which sends text to the browser instead of using speakers.
         """
         self.microphone_index = microphone_index
         self.speech_timeout = speech_timeout
         self.phrase_time_limit = phrase_time_limit
         self.ambient_noise_duration = ambient_noise_duration
-        self.recognizer = sr.Recognizer()
-        pygame.mixer.init()
+        self.enable_playback = enable_playback
+        self._recognizer: Optional["sr.Recognizer"] = None
+        self._vosk_model = self._load_vosk_model(vosk_model_path)
+
+        # Opened on first listen and held for the session (see _ensure_microphone)
+        self._mic: Optional["sr.Microphone"] = None
+        self._mic_source: Optional["sr.Microphone"] = None
+        self._listen_count = 0
+
+        # Opened on first playback; set by the decoder stream when a track ends
+        self._device: Optional["miniaudio.PlaybackDevice"] = None
+        self._playback_done = threading.Event()
+        self._playback_done.set()
+        self._playback_deadline = 0.0  # Monotonic time the current track should be over by
+
+        # LRU of synthesized mp3 bytes keyed by (text digest, language, slow)
+        self._tts_cache: "OrderedDict[Tuple[bytes, str, bool], bytes]" = OrderedDict()
+        self._tts_cache_lock = threading.Lock()
+
+        # Shared keep-alive connection pool for gTTS, warmed in the background
+        self._tts_session = requests.Session()
+        self._tts_session.mount(
+            "https://", HTTPAdapter(pool_connections=2, pool_maxsize=4)
+        )
+        if enable_playback:
+            threading.Thread(target=self._warm_tts_session, daemon=True).start()
         logger.info("✅ AudioManager initialized")
 
+    @property
+    def recognizer(self) -> "sr.Recognizer":
+        """Speech recognizer, created on first use."""
+        if self._recognizer is None:
+            import speech_recognition as sr
+
+            self._recognizer = sr.Recognizer()
+        return self._recognizer
+
     def listen_to_user(self) -> Optional[str]:
         """
-        Listen to microphone input and convert to text using Google Speech Recognition.
+        Listen to microphone input and convert to text.
+
+        Uses the local Vosk model when one is loaded, otherwise Google Speech Recognition.
 
         Returns:
             str: Transcribed user speech, or None if failed/timed out.
         """
+        import speech_recognition as sr
+
         try:
-            with sr.Microphone(device_index=self.microphone_index) as source:
-                logger.info("🎧 Listening...")
-                self.recognizer.adjust_for_ambient_noise(
-                    source, duration=self.ambient_noise_duration
-                )
-
-                audio = self.recognizer.listen(
-                    source,
-                    timeout=self.speech_timeout,
-                    phrase_time_limit=self.phrase_time_limit,
-                )
-
-                logger.debug("⏳ Processing speech...")
-                text = self.recognizer.recognize_google(audio)
-                logger.info(f"🗣️ Transcribed: {text}")
-                return text
+            source = self._ensure_microphone()
+            logger.info("🎧 Listening...")
+
+            if self._vosk_model is not None:
+                return self._listen_streaming(source)
+
+            audio = self.recognizer.listen(
+                source,
+                timeout=self.speech_timeout,
+                phrase_time_limit=self.phrase_time_limit,
+            )
+
+            logger.debug("⏳ Processing speech...")
+            text = self.recognizer.recognize_google(audio)
+            logger.info(f"🗣️ Transcribed: {text}")
+            return text
 
         except sr.WaitTimeoutError:
             logger.warning("⚠️ No speech detected (timeout)")
@@ -76,14 +204,137 @@ class AudioManager:
             return None
         except Exception as e:
             logger.error(f"❌ Microphone error: {e}")
+            # The stream may be dead; reopen (and recalibrate) it next turn
+            self._close_microphone()
             return None
 
+    def _ensure_microphone(self) -> "sr.Microphone":
+        """
+        Open the microphone once and keep it open across turns.
+
+        Ambient noise is calibrated on open and then only every
+        _RECALIBRATE_EVERY turns, instead of costing a full second per turn.
+
+        Returns:
+            sr.Microphone: The open microphone source.
+        """
+        if self._mic_source is None:
+            import speech_recognition as sr
+
+            mic = sr.Microphone(device_index=self.microphone_index)
+            self._mic_source = mic.__enter__()
+            self._mic = mic
+            self._listen_count = 0
+
+        if self._listen_count % self._RECALIBRATE_EVERY == 0:
+            logger.debug("🎚️ Calibrating for ambient noise...")
+            self.recognizer.adjust_for_ambient_noise(
+                self._mic_source, duration=self.ambient_noise_duration
+            )
+        self._listen_count += 1
+
+        return self._mic_source
+
+    def close(self) -> None:
+        """Release the microphone, output device and TTS connections."""
+        self._tts_session.close()
+
+        if self._device is not None:
+            self._device.close()
+            self._device = None
+            self._playback_done.set()
+
+        self._close_microphone()
+
+    def _close_microphone(self) -> None:
+        """Close the held microphone, if any, so the next listen opens a fresh one."""
+        if self._mic is not None:
+            try:
+                self._mic.__exit__(None, None, None)
+            except Exception as e:
+                logger.warning(f"⚠️ Could not close microphone: {e}")
+            self._mic = None
+            self._mic_source = None
+
+    @staticmethod
+    def _load_vosk_model(model_path: Optional[str]):
+        """Load the optional local Vosk model, or return None to use Google only."""
+        if not model_path:
+            return None
+        try:
+            from vosk import Model, SetLogLevel
+
+            SetLogLevel(-1)
+            model = Model(model_path)
+            logger.info(f"✅ Local speech model loaded from {model_path}")
+            return model
+        except ImportError:
+            logger.warning("⚠️ vosk is not installed - falling back to Google Speech Recognition")
+        except Exception as e:
+            logger.warning(f"⚠️ Could not load Vosk model ({e}) - falling back to Google Speech Recognition")
+        return None
+
+    def _listen_streaming(self, source: "sr.Microphone") -> Optional[str]:
+        """
+        Transcribe microphone chunks locally as they arrive.
+
+        Vosk finalizes as soon as it detects the end of the utterance, so the text
+        is ready right after the user stops talking. If it comes back empty, the
+        captured audio is sent to Google as a second opinion.
+
+        Args:
+            source: An open microphone source.
+
+        Returns:
+            str: Transcribed user speech, or None if nothing was understood.
+
+        Raises:
+            sr.WaitTimeoutError: If no speech starts within speech_timeout.
+        """
+        import speech_recognition as sr
+        from vosk import KaldiRecognizer
+
+        rec = KaldiRecognizer(self._vosk_model, source.SAMPLE_RATE)
+        frames = []
+        started = time.monotonic()
+        speech_started: Optional[float] = None  # When the first partial words showed up
+        text = ""
+
+        while True:
+            chunk = source.stream.read(source.CHUNK)
+            frames.append(chunk)
+            now = time.monotonic()
+
+            if rec.AcceptWaveform(chunk):
+                text = json.loads(rec.Result()).get("text", "")
+                if text:
+                    break
+            elif speech_started is None and json.loads(rec.PartialResult()).get("partial"):
+                speech_started = now
+
+            if speech_started is None:
+                if now - started > self.speech_timeout:
+                    raise sr.WaitTimeoutError("listening timed out while waiting for phrase to start")
+            # Like recognizer.listen, the phrase limit counts from when speech began
+            elif now - speech_started > self.phrase_time_limit:
+                text = json.loads(rec.FinalResult()).get("text", "")
+                break
+
+        if not text:
+            logger.debug("⏳ Local model heard nothing, asking Google...")
+            audio = sr.AudioData(b"".join(frames), source.SAMPLE_RATE, source.SAMPLE_WIDTH)
+            text = self.recognizer.recognize_google(audio)
+
+        logger.info(f"🗣️ Transcribed: {text}")
+        return text
+
     def speak_response(
         self,
         text: str,
         language: str = "en",
         slow: bool = False,
         pre_pause: float = 0.0,
+        blocking: bool = True,
     ) -> bool:
         """
         Convert text to speech and play it.
@@ -93,43 +344,140 @@ class AudioManager:
             language: Language code (default: "en").
             slow: If True, speak slowly.
             pre_pause: Pause before speaking in seconds.
+            blocking: If False, return as soon as playback starts. A following
+                call queues behind it; use wait_until_done() before listening.
 
         Returns:
             bool: True if successful, False otherwise.
         """
-        timestamp = int(time.time())
-        filename = f"response_{timestamp}.mp3"
+        if not self.enable_playback:
+            logger.debug("🔇 Playback disabled, not speaking")
+            return False
 
         try:
+            # Synthesize while any previous utterance is still playing
+            audio = self._synthesize(text, language, slow)
+            self.wait_until_done()
+
             if pre_pause:
                 time.sleep(pre_pause)
 
-            logger.debug(f"🔊 Generating speech ({len(text)} chars)")
-            tts = gTTS(text=text, lang=language, slow=slow)
-            tts.save(filename)
-
-            pygame.mixer.music.load(filename)
-            pygame.mixer.music.play()
-
-            while pygame.mixer.music.get_busy():
-                pygame.time.Clock().tick(10)
-
-            pygame.mixer.music.unload()
+            self._play(audio)
 
-            # Clean up temp file
-            try:
-                os.remove(filename)
-            except OSError:
-                pass
+            if blocking:
+                self.wait_until_done()
 
             logger.debug("✅ Speech played successfully")
             return True
 
         except Exception as e:
             logger.error(f"❌ TTS error: {e}")
-            # Try to clean up
-            try:
-                os.remove(filename)
-            except OSError:
-                pass
             return False
+
+    def prefetch_speech(
+        self,
+        text: str,
+        language: str = "en",
+        slow: bool = False,
+    ) -> bool:
+        """
+        Synthesize speech ahead of playback so a later speak_response is a cache hit.
+
+        Args:
+            text: The text that will be spoken.
+            language: Language code (default: "en").
+            slow: If True, speak slowly.
+
+        Returns:
+            bool: True if audio is ready in the cache, False otherwise.
+        """
+        try:
+            self._synthesize(text, language, slow)
+            return True
+        except Exception as e:
+            logger.warning(f"⚠️ TTS prefetch failed: {e}")
+            return False
+
+    def _synthesize(self, text: str, language: str, slow: bool) -> bytes:
+        """
+        Return mp3 bytes for the text, reusing cached audio for repeated phrases.
+
+        Args:
+            text: The text to speak.
+            language: Language code.
+            slow: If True, speak slowly.
+
+        Returns:
+            bytes: Encoded mp3 audio.
+        """
+        key = (
+            hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest(),
+            language,
+            slow,
+        )
+        with self._tts_cache_lock:
+            cached = self._tts_cache.get(key)
+            if cached is not None:
+                self._tts_cache.move_to_end(key)
+        if cached is not None:
+            logger.debug("🔊 Speech cache hit")
+            return cached
+
+        logger.debug(f"🔊 Generating speech ({len(text)} chars)")
+        tts = _pooled_tts_class()(text=text, lang=language, slow=slow, session=self._tts_session)
+        buf = io.BytesIO()
+        tts.write_to_fp(buf)
+        audio = buf.getvalue()
+
+        with self._tts_cache_lock:
+            self._tts_cache[key] = audio
+            if len(self._tts_cache) > self._TTS_CACHE_MAX:
+                self._tts_cache.popitem(last=False)
+
+        return audio
+
+    def _play(self, audio: bytes) -> None:
+        """Start decoding and playing mp3 bytes on the output device."""
+        import miniaudio
+
+        if self._device is None:
+            self._device = miniaudio.PlaybackDevice()
+
+        self._playback_done.clear()
+        try:
+            duration = miniaudio.mp3_get_info(audio).duration
+            self._playback_deadline = time.monotonic() + duration + self._PLAYBACK_GRACE
+
+            stream = _stream_until_done(
+                miniaudio.stream_memory(
+                    audio,
+                    output_format=self._device.format,
+                    nchannels=self._device.nchannels,
+                    sample_rate=self._device.sample_rate,
+                ),
+                self._playback_done,
+            )
+            next(stream)  # prime the generator before handing it to the device
+
+            self._device.stop()
+            self._device.start(stream)
+        except Exception:
+            # Nothing is playing, so don't leave waiters hanging
+            self._playback_done.set()
+            raise
+
+    def _warm_tts_session(self) -> None:
+        """Open a TLS connection to the TTS host so the first utterance skips the handshake."""
+        try:
+            r = self._tts_session.head("https://translate.google.com", timeout=3)
+            logger.debug(f"🔊 TTS connection warmed (Connection: {r.headers.get('Connection', 'n/a')})")
+        except requests.exceptions.RequestException as e:
+            logger.debug(f"TTS warm-up skipped: {e}")
+
+    def wait_until_done(self) -> None:
+        """Block until the current track has finished playing, or should have long ago."""
+        timeout = max(0.0, self._playback_deadline - time.monotonic())
+        if not self._playback_done.wait(timeout):
+            # The device stopped pulling audio (e.g. it was unplugged)
+            logger.warning("⚠️ Playback never reported finishing; moving on")
+            self._playback_done.set()
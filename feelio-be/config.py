@@ -40,10 +40,16 @@ class Config:
     SPEECH_TIMEOUT: int = int(os.getenv("SPEECH_TIMEOUT", "5"))
     SPEECH_PHRASE_LIMIT: int = int(os.getenv("SPEECH_PHRASE_LIMIT", "10"))
     AMBIENT_NOISE_DURATION: int = int(os.getenv("AMBIENT_NOISE_DURATION", "1"))
+    # Optional local speech model (requires `pip install vosk`); empty = Google only
+    VOSK_MODEL_PATH: str = os.getenv("VOSK_MODEL_PATH", "").strip()
 
     # Vision
     CAMERA_INDEX: int = int(os.getenv("CAMERA_INDEX", "0"))
     USE_VISION: bool = os.getenv("USE_VISION", "False").lower() == "true"
+    # Max /vision frames analyzed per second per session (0 = no limit)
+    VISION_MAX_FPS: float = float(os.getenv("VISION_MAX_FPS", "5"))
+    # Run frame resize/color conversion through OpenCL when OpenCV has it (drivers vary)
+    VISION_USE_OPENCL: bool = os.getenv("VISION_USE_OPENCL", "False").lower() == "true"
 
     # Model
     RESPONSE_MAX_LENGTH: int = int(os.getenv("RESPONSE_MAX_LENGTH", "3"))
@@ -83,6 +89,9 @@ class Config:
         if cls.SPEECH_TIMEOUT <= 0:
             raise ValueError("SPEECH_TIMEOUT must be > 0")
 
+        if cls.VISION_MAX_FPS < 0:
+            raise ValueError("VISION_MAX_FPS must be >= 0")
+
         logger.info(f"✅ Configuration validated (ENV: {cls.APP_ENV})")
         return True
 
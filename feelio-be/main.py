@@ -4,17 +4,25 @@ Main entry point for the application with proper error handling and logging.
 """
 
 import logging
+import os
+import queue
+import re
 import sys
 import signal
-from collections import deque
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, Tuple
 
-import google.generativeai as genai
+import orjson
 
 from config import Config
 from audio_module import AudioManager
 from vision_module import VisionSystem 
 from therapy_utils import (
     SessionLog,
+    EmotionHistory,
     update_emotion_history,
     summarize_trajectory,
     detect_contradiction,
@@ -22,7 +30,8 @@ from therapy_utils import (
     select_playbook,
     build_fusion_prompt,
     build_summary_prompt,
-    build_crisis_response,
+    CRISIS_RESPONSE,
+    split_sentences,
     extract_word_count,
     determine_pace_hint,
     get_pre_pause_duration,
@@ -50,12 +59,19 @@ def setup_logging(log_level: str = "INFO") -> None:
 
 logger = logging.getLogger(__name__)
 
+# Whole words only, so "nonstop" or "exiting" don't end the session
+_EXIT_RE = re.compile(r"\b(?:bye|goodbye|stop|exit|quit)\b")
+
 
 # ========== THERAPIST CLASS ==========
 
 class FeelioTherapist:
     """Main therapist orchestrator with 'Friendly Human' Persona."""
 
+    # Replies reused when a session repeats the same words with the same emotion
+    RESPONSE_CACHE_MAX = 256
+    RESPONSE_CACHE_TTL = 600.0  # seconds
+
     # --- 🧠 THE NEW "HUMAN" BRAIN ---
     THERAPIST_INSTRUCTIONS = """
     You are **Dr. Libra**, but you are NOT a robot. 
@@ -94,19 +110,40 @@ class FeelioTherapist:
     Immediately express urgent concern and provide resources. Do not try to 'therapize' a crisis.
     """
 
-    def __init__(self, config: Config):
+    # Per-turn prompt; filled with the user's face and words
+    FUSION_PROMPT_TMPL = """
+    [SCENE DATA]
+    User's Face: {face}
+    User's Words: "{text}"
+
+    [INSTRUCTION]
+    Reply to the user as Dr. Libra (Friendly Therapist).
+    1. React to their face if it's relevant (especially if it contradicts their words).
+    2. Validate their feeling warmly.
+    3. Keep it short (2-3 sentences max) and conversational.
+    """
+
+    def __init__(self, config: Config, enable_playback: bool = True):
         """
         Initialize the therapist.
+
+        Args:
+            config: Application configuration.
+            enable_playback: Set False when replies are delivered as text
+                (the API server), so no audio output is ever opened.
         """
         self.config = config
         self.session_log = SessionLog()
-        self.emotion_history: deque = deque(maxlen=180)
+        self.emotion_history = EmotionHistory(maxlen=180)
         self.is_running = True
 
         # --- VISION SETUP ---
-        self.vision = VisionSystem()
+        self.vision = VisionSystem(use_opencl=config.VISION_USE_OPENCL)
         
         # Initialize Gemini with the new "Human" Config
+        # (imported here: the SDK is slow to load and only needed once we start)
+        import google.generativeai as genai
+
         genai.configure(api_key=config.GEMINI_API_KEY)
         self.model = genai.GenerativeModel(
             config.MODEL_NAME,
@@ -121,8 +158,25 @@ class FeelioTherapist:
             speech_timeout=config.SPEECH_TIMEOUT,
             phrase_time_limit=config.SPEECH_PHRASE_LIMIT,
             ambient_noise_duration=config.AMBIENT_NOISE_DURATION,
+            vosk_model_path=config.VOSK_MODEL_PATH or None,
+            enable_playback=enable_playback,
         )
 
+        # Synthesizes speech for finished sentences while Gemini is still streaming
+        self._tts_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="tts")
+
+        # Sentences waiting to be spoken, in order; drained by the playback thread
+        self._speech_queue: queue.Queue = queue.Queue()
+        self._playback_thread: Optional[threading.Thread] = None
+
+        # (session id, emotion, normalized words) -> (reply, stored_at)
+        self._resp_cache: "OrderedDict[Tuple[str, str, str], Tuple[str, float]]" = OrderedDict()
+        self._resp_cache_lock = threading.Lock()
+
+        # Serializes everything that touches chat_session (the server calls in
+        # from several threads)
+        self._chat_lock = threading.Lock()
+
         logger.info("Feelio Therapist initialized with 'Friendly Therapist' Persona")
 
     def handle_signal(self, signum, frame) -> None:
@@ -142,6 +196,11 @@ class FeelioTherapist:
         # Server mode calls vision explicitly via API)
         # self.vision.start() 
 
+        self._playback_thread = threading.Thread(
+            target=self._playback_worker, name="playback", daemon=True
+        )
+        self._playback_thread.start()
+
         try:
             while self.is_running:
                 # 1. UI Update
@@ -154,43 +213,56 @@ class FeelioTherapist:
                 if not user_input:
                     continue
 
+                # Lowercase once; every keyword check below works on this copy
+                lowered = user_input.lower()
+
                 # 3. Check emotion
                 # For local run, we grab emotion manually. For Server run, this is passed in.
                 # current_emotion = self.vision.get_emotion()
                 current_emotion = "neutral" # Default for pure audio loop
+                update_emotion_history(current_emotion, self.emotion_history)
                 logger.info(f"Emotion captured for response: {current_emotion}")
 
                 # 4. Check exit commands
-                if self._should_exit(user_input):
+                if self._should_exit(lowered):
                     self.audio.speak_response("It was good to speak with you. Take care.")
                     break
 
                 # 5. Check high-risk content
-                if self.config.ENABLE_SAFETY_NET and detect_high_risk(user_input):
-                    crisis_response = build_crisis_response()
+                if self.config.ENABLE_SAFETY_NET and detect_high_risk(lowered):
                     logger.warning("High-risk content detected - activating crisis protocol")
                     self.audio.speak_response(
-                        crisis_response,
+                        CRISIS_RESPONSE,
                         slow=True,
                         pre_pause=0.5,
                     )
-                    self.session_log.add_turn(user_input, crisis_response, current_emotion)
+                    self.session_log.add_turn(user_input, CRISIS_RESPONSE, current_emotion)
                     continue
 
-                # 6. Generate and deliver response
-                ai_response = self._generate_response(user_input, current_emotion)
-                self.session_log.add_turn(user_input, ai_response, current_emotion)
-
-                # 7. Deliver with adaptive pacing
+                # 6. Pick pacing up front so speech can start while generating
                 word_count = extract_word_count(user_input)
                 pace_hint = determine_pace_hint(word_count)
                 pre_pause = get_pre_pause_duration(pace_hint)
+                slow = pace_hint == "slower"
 
-                self.audio.speak_response(
-                    ai_response,
-                    slow=(pace_hint == "slower"),
-                    pre_pause=pre_pause,
+                # 7. Generate and deliver response. Each sentence is spoken as
+                # soon as it streams in, while Gemini keeps writing the rest.
+                sentences_queued = 0
+
+                def speak_sentence(sentence: str) -> None:
+                    nonlocal sentences_queued
+                    pause = pre_pause if sentences_queued == 0 else 0.0
+                    self._queue_speech(sentence, slow=slow, pre_pause=pause)
+                    sentences_queued += 1
+
+                ai_response = self._generate_response(
+                    user_input, current_emotion, on_sentence=speak_sentence, lowered=lowered
                 )
+                self.session_log.add_turn(user_input, ai_response, current_emotion)
+
+                # Don't listen while Dr. Libra is still talking
+                self._speech_queue.join()
+                self.audio.wait_until_done()
 
         except KeyboardInterrupt:
             logger.info("Keyboard interrupt received")
@@ -201,45 +273,175 @@ class FeelioTherapist:
         finally:
             self._cleanup()
 
-    def _should_exit(self, user_input: str) -> bool:
-        """Check if user wants to exit."""
-        lowered = user_input.lower()
-        return any(word in lowered for word in ["bye", "goodbye", "stop", "exit", "quit"])
-
-    def _generate_response(self, user_text: str, current_emotion: str) -> str:
+    def _should_exit(self, lowered_input: str) -> bool:
+        """Check if user wants to exit (expects lowercased input)."""
+        return _EXIT_RE.search(lowered_input) is not None
+
+    def _generate_response(
+        self,
+        user_text: str,
+        current_emotion: str,
+        on_sentence: Optional[Callable[[str], None]] = None,
+        session_id: str = "local",
+        lowered: Optional[str] = None,
+    ) -> str:
         """
         Generate AI response using fusion logic with Human Persona.
+
+        If on_sentence is given, it is called with each sentence as soon as it
+        has streamed in, so speech can overlap the rest of generation.
+        Replies to words this session_id recently said with the same emotion
+        are served from cache; the exchange is still added to the chat history.
+        Pass lowered if the caller already has user_text lowercased.
+        """
+        # We inject the visual context explicitly into the prompt
+        # This ensures the 'Friendly Therapist' persona sees the user.
+        fusion_prompt = self.FUSION_PROMPT_TMPL.format_map(
+            {"face": current_emotion.upper(), "text": user_text}
+        )
+
+        if lowered is None:
+            lowered = user_text.lower()
+        cache_key = (session_id, current_emotion, lowered.strip())
+        cacheable = not detect_high_risk(lowered)
+        if cacheable:
+            cached = self._get_cached_response(cache_key)
+            if cached is not None:
+                logger.info("Response served from cache")
+                self._record_exchange(fusion_prompt, cached)
+                if on_sentence is not None:
+                    for sentence in split_sentences(cached):
+                        on_sentence(sentence)
+                return cached
+
+        # One ChatSession is shared by every caller; a reply has to finish
+        # streaming before the next send_message reads its history
+        spoken = []  # Sentences already handed to on_sentence, in order
+        with self._chat_lock:
+            try:
+                if on_sentence is None:
+                    # Nobody is waiting on partial text (e.g. the API server), so
+                    # skip streaming and its extra failure modes
+                    response = self.chat_session.send_message(fusion_prompt)
+                    ai_text = response.text.replace("*", "").strip()
+                else:
+                    response = self.chat_session.send_message(fusion_prompt, stream=True)
+
+                    buffer = ""
+                    emitted = 0
+                    for chunk in response:
+                        buffer += chunk.text.replace("*", "")
+                        # The last piece may still be growing; only emit finished sentences
+                        finished = split_sentences(buffer)[:-1]
+                        for sentence in finished[emitted:]:
+                            on_sentence(sentence)
+                            spoken.append(sentence)
+                        emitted = len(finished)
+
+                    ai_text = buffer.strip()
+                    for sentence in split_sentences(ai_text)[emitted:]:
+                        on_sentence(sentence)
+                        spoken.append(sentence)
+
+                logger.info(f"Response generated ({len(ai_text)} chars)")
+                if cacheable and ai_text:
+                    self._store_cached_response(cache_key, ai_text)
+                return ai_text
+
+            except Exception as e:
+                logger.error(f"Response generation error: {e}", exc_info=True)
+                self._recover_chat_session()
+                if spoken:
+                    # The user already heard part of a reply; report just that
+                    # rather than tacking an apology onto it
+                    return " ".join(spoken)
+                fallback = "I'm having a little trouble connecting to my thoughts right now. Try again?"
+                # The voice loop only speaks what comes through on_sentence
+                if on_sentence is not None:
+                    on_sentence(fallback)
+                return fallback
+
+    def _record_exchange(self, fusion_prompt: str, ai_text: str) -> None:
+        """Append a turn answered without Gemini (a cache hit) to the chat history."""
+        try:
+            with self._chat_lock:
+                self.chat_session.history = [
+                    *self.chat_session.history,
+                    {"role": "user", "parts": [fusion_prompt]},
+                    {"role": "model", "parts": [ai_text]},
+                ]
+        except Exception as e:
+            logger.warning(f"Could not add cached reply to chat history: {e}")
+
+    def _recover_chat_session(self) -> None:
+        """
+        Drop a broken exchange after a failed reply.
+
+        A stream that errors or stops early (e.g. a SAFETY finish) leaves the
+        chat session unable to build its history, and every later send_message
+        would raise BrokenResponseError. Rewinding forgets just that turn.
         """
+        if self.chat_session.last is None:
+            return
         try:
-            # We inject the visual context explicitly into the prompt
-            # This ensures the 'Friendly Therapist' persona sees the user.
-            fusion_prompt = f"""
-            [SCENE DATA]
-            User's Face: {current_emotion.upper()}
-            User's Words: "{user_text}"
-            
-            [INSTRUCTION]
-            Reply to the user as Dr. Libra (Friendly Therapist).
-            1. React to their face if it's relevant (especially if it contradicts their words).
-            2. Validate their feeling warmly.
-            3. Keep it short (2-3 sentences max) and conversational.
-            """
-
-            response = self.chat_session.send_message(fusion_prompt)
-            ai_text = response.text.replace("*", "").strip()
-
-            logger.info(f"Response generated ({len(ai_text)} chars)")
+            self.chat_session.history  # Commits the last exchange if it's intact
+        except Exception:
+            self.chat_session.rewind()
+            logger.warning("Dropped a broken exchange from the chat history")
+
+    def _queue_speech(self, sentence: str, slow: bool, pre_pause: float) -> None:
+        """Start synthesizing a sentence now and queue it for in-order playback."""
+        synth = self._tts_executor.submit(self.audio.prefetch_speech, sentence, slow=slow)
+        self._speech_queue.put((sentence, slow, pre_pause, synth))
+
+    def _playback_worker(self) -> None:
+        """Speak queued sentences one after another until a None sentinel arrives."""
+        while True:
+            item = self._speech_queue.get()
+            try:
+                if item is None:
+                    return
+                sentence, slow, pre_pause, synth = item
+                synth.result()  # audio is in the TTS cache once this returns
+                self.audio.speak_response(
+                    sentence, slow=slow, pre_pause=pre_pause, blocking=False
+                )
+            except Exception as e:
+                logger.error(f"Playback error: {e}")
+            finally:
+                self._speech_queue.task_done()
+
+    def _get_cached_response(self, key: Tuple[str, str, str]) -> Optional[str]:
+        """Return a fresh cached reply for the key, dropping it if expired."""
+        with self._resp_cache_lock:
+            hit = self._resp_cache.get(key)
+            if hit is None:
+                return None
+            ai_text, stored_at = hit
+            if time.monotonic() - stored_at > self.RESPONSE_CACHE_TTL:
+                del self._resp_cache[key]
+                return None
+            self._resp_cache.move_to_end(key)
             return ai_text
 
-        except Exception as e:
-            logger.error(f"Response generation error: {e}", exc_info=True)
-            return "I'm having a little trouble connecting to my thoughts right now. Try again?"
+    def _store_cached_response(self, key: Tuple[str, str, str], ai_text: str) -> None:
+        """Remember a reply, evicting the least recently used one when full."""
+        with self._resp_cache_lock:
+            self._resp_cache[key] = (ai_text, time.monotonic())
+            self._resp_cache.move_to_end(key)
+            if len(self._resp_cache) > self.RESPONSE_CACHE_MAX:
+                self._resp_cache.popitem(last=False)
 
     def _cleanup(self) -> None:
         """Cleanup and generate session summary."""
         logger.info("Cleaning up...")
         
         # self.vision.stop()
+        if self._playback_thread is not None:
+            self._speech_queue.put(None)
+            self._playback_thread.join(timeout=5)
+        self._tts_executor.shutdown(wait=False, cancel_futures=True)
+        self.audio.close()
 
         # Generate and display session summary
         if len(self.session_log) > 0:
@@ -267,25 +469,32 @@ class FeelioTherapist:
             logger.info("Session ended with no conversation")
 
     def _save_session(self) -> None:
-        """Save session to file if configured."""
+        """Save session to file if configured, writing it on a background thread."""
+        timestamp = int(time.time())
+        session_data = {
+            "timestamp": timestamp,
+            "turns": self.session_log.get_recent_turns(count=len(self.session_log)),
+        }
+
+        # Not a daemon: cleanup returns right away, but the process still waits
+        # for the file to be written before exiting.
+        threading.Thread(
+            target=self._write_session,
+            args=(session_data,),
+            name="session-save",
+        ).start()
+
+    def _write_session(self, session_data: dict) -> None:
+        """Write a session snapshot to SESSION_LOGS_PATH."""
         try:
-            import json
-            import os
-
             os.makedirs(self.config.SESSION_LOGS_PATH, exist_ok=True)
-            timestamp = int(__import__("time").time())
             filename = os.path.join(
                 self.config.SESSION_LOGS_PATH,
-                f"session_{timestamp}.json"
+                f"session_{session_data['timestamp']}.json"
             )
 
-            session_data = {
-                "timestamp": timestamp,
-                "turns": self.session_log.get_recent_turns(count=len(self.session_log)),
-            }
-
-            with open(filename, "w") as f:
-                json.dump(session_data, f, indent=2)
+            with open(filename, "wb") as f:
+                f.write(orjson.dumps(session_data, option=orjson.OPT_INDENT_2))
 
             logger.info(f"Session saved to {filename}")
 
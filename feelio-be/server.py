@@ -1,5 +1,11 @@
 # feelio-be/server.py
+import asyncio
 import base64
+import hashlib
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 import cv2
 import numpy as np
 import uvicorn
@@ -7,13 +13,16 @@ from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from main import FeelioTherapist, Config, setup_logging
+from vision_module import MAX_FRAME_SIDE
 
 # Define Data Models
 class UserMessage(BaseModel):
     message: str
+    session_id: str = "default"  # Lets several browser tabs/clients keep separate moods
 
 class ImagePayload(BaseModel):
     image: str  # Base64 encoded image from frontend
+    session_id: str = "default"
 
 app = FastAPI()
 
@@ -26,7 +35,55 @@ app.add_middleware(
 )
 
 therapist = None
-last_detected_emotion = "neutral"  # Store the last emotion we saw
+
+# Blocking work runs off the event loop. MediaPipe's FaceMesh isn't thread-safe,
+# so frames go through a single worker. The therapist's single Gemini chat is
+# locked per reply, so chat workers mostly overlap cache hits and waiting.
+vision_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="vision")
+chat_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="chat")
+
+# Majority vote over this many analyzed frames, so a face sitting right on a
+# threshold doesn't flicker between "neutral" and "happy"
+EMOTION_SMOOTHING = 5
+
+class SessionState:
+    """What we remember about one client between requests"""
+
+    def __init__(self):
+        self.emotion = "neutral"    # Last emotion we saw
+        self.last_vision_ts = 0.0   # When we last started analyzing a frame
+        self.vision_busy = False    # A frame is being analyzed right now
+        self.recent_emotions = deque(maxlen=EMOTION_SMOOTHING)  # Raw per-frame results
+
+    def observe(self, emotion):
+        """Record one frame's emotion and settle on the majority of the recent ones"""
+        recent = self.recent_emotions
+        recent.append(emotion)
+        # Ties go to the newest label so a real change still shows up promptly
+        self.emotion = max(reversed(recent), key=recent.count)
+        return self.emotion
+
+# Per-session state. Only touched from the event loop, so no lock.
+MAX_SESSIONS = 1024
+sessions = OrderedDict()
+
+# Frames arriving faster than this are answered with the last emotion
+MIN_VISION_INTERVAL = 1.0 / Config.VISION_MAX_FPS if Config.VISION_MAX_FPS > 0 else 0.0
+
+# Emotion for recently seen snapshots, keyed by a hash of the raw base64 payload.
+# A still user often sends byte-identical frames; those skip decode + MediaPipe.
+MAX_FRAME_CACHE = 128
+frame_cache = OrderedDict()
+
+def get_session(session_id):
+    state = sessions.get(session_id)
+    if state is None:
+        state = sessions[session_id] = SessionState()
+        if len(sessions) > MAX_SESSIONS:
+            sessions.popitem(last=False)
+    else:
+        sessions.move_to_end(session_id)
+    return state
 
 @app.on_event("startup")
 def startup_event():
@@ -36,9 +93,31 @@ def startup_event():
     print("🚀 Dr. Libra is initializing...")
     
     # Initialize Therapist BUT DO NOT start the vision loop automatically
-    therapist = FeelioTherapist(Config)
+    # Replies go back to the browser as text, so the server never needs speakers
+    therapist = FeelioTherapist(Config, enable_playback=False)
     print("✅ Dr. Libra is READY! (Waiting for images from Frontend)")
 
+# Start-of-frame markers (baseline, progressive, ...); 0xC4/0xC8/0xCC are other segments
+_JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+def jpeg_width(data):
+    """Pixel width from a JPEG's frame header, or None if it isn't a readable JPEG"""
+    if data[:2] != b"\xff\xd8":
+        return None
+    i = 2
+    while i + 9 <= len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:  # Fill byte before a marker
+            i += 1
+            continue
+        if marker in _JPEG_SOF_MARKERS:
+            # FF Cn, length(2), precision(1), height(2), width(2)
+            return int.from_bytes(data[i + 7:i + 9], "big")
+        i += 2 + int.from_bytes(data[i + 2:i + 4], "big")
+    return None
+
 def base64_to_image(base64_string):
     """Convert base64 string from React to an OpenCV image"""
     try:
@@ -48,39 +127,83 @@ def base64_to_image(base64_string):
         
         image_bytes = base64.b64decode(base64_string)
         nparr = np.frombuffer(image_bytes, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        # Let libjpeg skip half the pixels, but only when the result is still at
+        # least as big as VisionSystem's working size; it does the one resize
+        width = jpeg_width(image_bytes)
+        if width is not None and width >= 2 * MAX_FRAME_SIDE:
+            img = cv2.imdecode(nparr, cv2.IMREAD_REDUCED_COLOR_2)
+        else:
+            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
         return img
     except Exception as e:
         print(f"❌ Image Decode Error: {e}")
         return None
 
+def detect_emotion(base64_string, session_id):
+    """Decode a snapshot and run MediaPipe on it (blocking)"""
+    # 1. Convert Base64 -> OpenCV Image
+    frame = base64_to_image(base64_string)
+    if frame is None:
+        return None
+    # 2. Run MediaPipe on this single frame
+    return therapist.vision.analyze_frame(frame, stream=session_id)
+
 @app.post("/vision")
-def analyze_vision(payload: ImagePayload):
+async def analyze_vision(payload: ImagePayload):
     """React sends a snapshot -> We return the emotion"""
-    global last_detected_emotion
-    
-    # 1. Convert Base64 -> OpenCV Image
-    frame = base64_to_image(payload.image)
-    
-    if frame is not None:
-        # 2. Run MediaPipe on this single frame
-        # We manually call the detector on this specific frame
-        emotion = therapist.vision.analyze_frame(frame) # You might need to expose this method or create a helper
+    session = get_session(payload.session_id)
+
+    # Coalesce bursts: MediaPipe doesn't need every frame to track a mood, and a
+    # frame that arrives while this session's previous one is in flight is stale.
+    now = time.monotonic()
+    if session.vision_busy or now - session.last_vision_ts < MIN_VISION_INTERVAL:
+        return {"emotion": session.emotion}
+
+    frame_key = hashlib.blake2b(payload.image.encode(), digest_size=8).digest()
+    emotion = frame_cache.get(frame_key)
+    if emotion is not None:
+        frame_cache.move_to_end(frame_key)
+    else:
+        session.last_vision_ts = now
+        session.vision_busy = True
+        try:
+            loop = asyncio.get_running_loop()
+            emotion = await loop.run_in_executor(
+                vision_pool, detect_emotion, payload.image, payload.session_id
+            )
+        finally:
+            session.vision_busy = False
         if emotion:
-            last_detected_emotion = emotion
-            
-    return {"emotion": last_detected_emotion}
+            frame_cache[frame_key] = emotion
+            if len(frame_cache) > MAX_FRAME_CACHE:
+                frame_cache.popitem(last=False)
+
+    if emotion:
+        session.observe(emotion)
+
+    return {"emotion": session.emotion}
 
 @app.post("/chat")
-def chat_endpoint(user_input: UserMessage):
+async def chat_endpoint(user_input: UserMessage):
     """React sends text -> We use the LAST detected emotion to reply"""
     try:
-        # Generate response using the last emotion we saw from the snapshots
-        response_text = therapist._generate_response(user_input.message, last_detected_emotion)
+        # Generate response using the last emotion we saw from this session's snapshots.
+        # The Gemini call blocks, so keep it off the event loop.
+        emotion = get_session(user_input.session_id).emotion
+        loop = asyncio.get_running_loop()
+        response_text = await loop.run_in_executor(
+            chat_pool,
+            partial(
+                therapist._generate_response,
+                user_input.message,
+                emotion,
+                session_id=user_input.session_id,
+            ),
+        )
         
         return {
             "reply": response_text,
-            "detected_emotion": last_detected_emotion
+            "detected_emotion": emotion
         }
     except Exception as e:
         print(f"Error: {e}")
@@ -4,11 +4,15 @@ Contains core therapeutic logic, NLP utilities, and session management.
 """
 
 import logging
+import re
 import time
 from collections import deque
-from typing import Tuple, Optional, List, Dict, Any
+from itertools import islice
+from typing import Tuple, Optional, List, Dict, Any, NamedTuple
 from enum import Enum
 
+import numpy as np
+
 logger = logging.getLogger(__name__)
 
 
@@ -22,8 +26,8 @@ class TherapyMode(Enum):
 
 # ========== EMOTION MANAGEMENT ==========
 
-DISTRESS_EMOTIONS = {"sad", "fear", "angry", "disgust", "surprise"}
-SAFETY_KEYWORDS = [
+DISTRESS_EMOTIONS = frozenset({"sad", "fear", "angry", "disgust", "surprise"})
+SAFETY_KEYWORDS = (
     "suicide",
     "kill myself",
     "end my life",
@@ -34,7 +38,11 @@ SAFETY_KEYWORDS = [
     "want to die",
     "no reason to live",
     "give up",
-]
+)
+_SAFETY_RE = re.compile("|".join(re.escape(phrase) for phrase in SAFETY_KEYWORDS))
+
+# Words that claim things are fine; whole words only so "define"/"goodbye" don't count
+_FINE_RE = re.compile(r"\b(?:fine|okay|good)\b")
 
 PLAYBOOKS = {
     "sad": "Run a 5-minute activation: stand, stretch, and text one friend a kind line.",
@@ -45,28 +53,95 @@ PLAYBOOKS = {
     "neutral": "Micro check-in: what mattered most today? Pick one tiny action that honors it in 5 minutes.",
     "default": "Pick one concrete action in 5 minutes (move, text, or jot a thought). Keep it small and doable.",
 }
+_DEFAULT_PLAYBOOK = PLAYBOOKS["default"]
+
+
+class EmotionHistory:
+    """
+    Fixed-size ring buffer of timestamped emotion labels.
+
+    Labels and timestamps live in two parallel preallocated numpy arrays instead
+    of a deque of (timestamp, emotion) tuples, so summaries can count labels in
+    a single vectorized pass and no per-turn tuple or float object is kept.
+    """
+
+    def __init__(self, maxlen: int = 180):
+        """
+        Initialize the ring.
+
+        Args:
+            maxlen: Number of most recent emotions to keep.
+        """
+        self.maxlen = maxlen
+        self._labels = np.empty(maxlen, dtype="<U16")
+        self._timestamps = np.empty(maxlen, dtype=np.float64)
+        self._head = 0
+        self._count = 0
+
+    def push(self, emotion: str, timestamp: Optional[float] = None) -> None:
+        """Append an emotion (stamped now by default), overwriting the oldest once full."""
+        self._labels[self._head] = emotion
+        self._timestamps[self._head] = time.time() if timestamp is None else timestamp
+        self._head = (self._head + 1) % self.maxlen
+        self._count = min(self._count + 1, self.maxlen)
+
+    def _tail(self, column: np.ndarray, count: Optional[int]) -> np.ndarray:
+        """Last `count` slots of a column, oldest first."""
+        n = self._count if count is None else min(count, self._count)
+        start = (self._head - n) % self.maxlen
+        if start + n <= self.maxlen:
+            return column[start:start + n]
+        return np.concatenate((column[start:], column[:start + n - self.maxlen]))
+
+    def recent(self, count: Optional[int] = None) -> np.ndarray:
+        """
+        Get the most recent emotions, oldest first.
+
+        Args:
+            count: Number of emotions to return (default: all stored).
+
+        Returns:
+            Array of emotion labels.
+        """
+        return self._tail(self._labels, count)
+
+    def recent_timestamps(self, count: Optional[int] = None) -> np.ndarray:
+        """
+        Get when the most recent emotions were logged, oldest first.
+
+        Args:
+            count: Number of timestamps to return (default: all stored).
+
+        Returns:
+            Array of Unix timestamps, aligned with recent(count).
+        """
+        return self._tail(self._timestamps, count)
+
+    def __len__(self) -> int:
+        """Return number of stored emotions."""
+        return self._count
 
 
 def update_emotion_history(
-    emotion: str, emotion_history: deque
+    emotion: str, emotion_history: EmotionHistory
 ) -> None:
     """
     Store a timestamped emotion in the rolling history buffer.
 
     Args:
         emotion: The current emotion label.
-        emotion_history: A deque to store (timestamp, emotion) tuples.
+        emotion_history: The ring buffer to append to.
     """
-    emotion_history.append((time.time(), emotion))
+    emotion_history.push(emotion)
     logger.debug(f"Emotion logged: {emotion}")
 
 
-def summarize_trajectory(emotion_history: deque) -> str:
+def summarize_trajectory(emotion_history: EmotionHistory) -> str:
     """
     Describe how emotion has shifted recently.
 
     Args:
-        emotion_history: Deque of (timestamp, emotion) tuples.
+        emotion_history: Ring buffer of recent emotions.
 
     Returns:
         str: A human-readable description of the emotional trajectory.
@@ -74,29 +149,29 @@ def summarize_trajectory(emotion_history: deque) -> str:
     if len(emotion_history) < 4:
         return "steady so far"
 
-    recent = [e for _, e in list(emotion_history)[-20:]]
+    recent = emotion_history.recent(20)
     start, end = recent[0], recent[-1]
 
     if start != end:
         return f"from {start} toward {end}"
 
-    dominant = max(set(recent), key=recent.count)
+    labels, counts = np.unique(recent, return_counts=True)
+    dominant = labels[counts.argmax()]
     return f"mostly {dominant}"
 
 
-def detect_contradiction(user_text: str, current_emotion: str) -> str:
+def detect_contradiction(lowered_text: str, current_emotion: str) -> str:
     """
     Flag when words say 'fine' but facial emotion shows distress.
 
     Args:
-        user_text: The user's spoken input.
+        lowered_text: The user's spoken input, already lowercased.
         current_emotion: The detected facial emotion.
 
     Returns:
         str: A flag message if contradiction detected, else "none noted".
     """
-    text = user_text.lower()
-    says_fine = any(token in text for token in ["fine", "okay", "good"])
+    says_fine = _FINE_RE.search(lowered_text) is not None
     looks_distressed = current_emotion in DISTRESS_EMOTIONS
 
     if says_fine and looks_distressed:
@@ -105,18 +180,17 @@ def detect_contradiction(user_text: str, current_emotion: str) -> str:
     return "none noted"
 
 
-def detect_high_risk(user_text: str) -> bool:
+def detect_high_risk(lowered_text: str) -> bool:
     """
     Simple keyword-based safety net for self-harm detection.
 
     Args:
-        user_text: The user's spoken input.
+        lowered_text: The user's spoken input, already lowercased.
 
     Returns:
         bool: True if high-risk keywords detected, False otherwise.
     """
-    lowered = user_text.lower()
-    detected = any(phrase in lowered for phrase in SAFETY_KEYWORDS)
+    detected = _SAFETY_RE.search(lowered_text) is not None
 
     if detected:
         logger.warning(f"⚠️ High-risk content detected in user input")
@@ -124,50 +198,38 @@ def detect_high_risk(user_text: str) -> bool:
     return detected
 
 
-def select_playbook(emotion: str, user_text: str) -> str:
+def select_playbook(emotion: str, lowered_text: str) -> str:
     """
     Choose a targeted therapeutic playbook based on emotion and intent.
 
     Args:
         emotion: The current emotion label.
-        user_text: The user's input text.
+        lowered_text: The user's input text, already lowercased.
 
     Returns:
         str: A coping strategy or mini-protocol.
     """
-    text = user_text.lower()
-
-    # Intent-based routing
-    if "panic" in text or "anxious" in text:
+    # Intent-based routing (plain substring tests beat a regex at these lengths)
+    if "panic" in lowered_text or "anxious" in lowered_text:
         return "Panic kit: 3 paced breaths (inhale 4, exhale 6) plus name 3 things you see."
-    if "sleep" in text or "insomnia" in text:
+    if "sleep" in lowered_text or "insomnia" in lowered_text:
         return "Sleep wind-down: lights dim, slow exhale 6s for 1 minute, then write one worry and shelve it till morning."
-    if "overwhelm" in text or "burnout" in text:
+    if "overwhelm" in lowered_text or "burnout" in lowered_text:
         return "Overwhelm triage: list top 3 tasks, pick one 10-minute starter and ignore the rest for 30 minutes."
 
-    # Emotion-based routing
-    if emotion in PLAYBOOKS:
-        return PLAYBOOKS[emotion]
-
-    return PLAYBOOKS["default"]
+    # Emotion-based routing (one dict probe, falling back to the default)
+    return PLAYBOOKS.get(emotion, _DEFAULT_PLAYBOOK)
 
 
 # ========== SESSION LOGGING ==========
 
-class SessionEntry:
-    """Represents a single turn in a therapy session."""
-
-    def __init__(
-        self,
-        user_text: str,
-        ai_text: str,
-        emotion: str,
-        timestamp: Optional[float] = None,
-    ):
-        self.user_text = user_text
-        self.ai_text = ai_text
-        self.emotion = emotion
-        self.timestamp = timestamp or time.time()
+class SessionEntry(NamedTuple):
+    """Represents a single turn in a therapy session (a row view of SessionLog)."""
+
+    user_text: str
+    ai_text: str
+    emotion: str
+    timestamp: float
 
     def to_dict(self) -> Dict[str, Any]:
         """Convert entry to dictionary."""
@@ -180,7 +242,12 @@ class SessionEntry:
 
 
 class SessionLog:
-    """Manages session logging and summary generation."""
+    """
+    Manages session logging and summary generation.
+
+    Turns are stored column-wise (one deque per field) so that reading a single
+    field, like the emotion timeline, doesn't touch the others.
+    """
 
     def __init__(self, max_entries: int = 100):
         """
@@ -189,7 +256,11 @@ class SessionLog:
         Args:
             max_entries: Maximum number of entries to keep in memory.
         """
-        self.entries: List[SessionEntry] = []
+        # Oldest turns fall off the left end automatically once full
+        self._timestamps: deque = deque(maxlen=max_entries)
+        self._emotions: deque = deque(maxlen=max_entries)
+        self._user_texts: deque = deque(maxlen=max_entries)
+        self._ai_texts: deque = deque(maxlen=max_entries)
         self.max_entries = max_entries
 
     def add_turn(self, user_text: str, ai_text: str, emotion: str) -> None:
@@ -201,13 +272,26 @@ class SessionLog:
             ai_text: AI's response.
             emotion: Detected emotion at time of turn.
         """
-        entry = SessionEntry(user_text, ai_text, emotion)
-        self.entries.append(entry)
-
-        if len(self.entries) > self.max_entries:
-            self.entries.pop(0)
-
-        logger.debug(f"Session turn logged (total: {len(self.entries)})")
+        self._timestamps.append(time.time())
+        self._emotions.append(emotion)
+        self._user_texts.append(user_text)
+        self._ai_texts.append(ai_text)
+
+        logger.debug(f"Session turn logged (total: {len(self)})")
+
+    @property
+    def entries(self) -> List[SessionEntry]:
+        """All logged turns as SessionEntry objects, oldest first."""
+        return [
+            SessionEntry(user, ai, emotion, ts)
+            for ts, emotion, user, ai in zip(
+                self._timestamps, self._emotions, self._user_texts, self._ai_texts
+            )
+        ]
+
+    def _tail(self, column: deque, count: int):
+        """Iterate over the last `count` items of a column."""
+        return islice(column, max(0, len(column) - count), None)
 
     def get_emotion_timeline(self, recent_count: int = 20) -> List[str]:
         """
@@ -219,8 +303,7 @@ class SessionLog:
         Returns:
             List of emotion labels.
         """
-        recent = self.entries[-recent_count:]
-        return [e.emotion for e in recent]
+        return list(self._tail(self._emotions, recent_count))
 
     def get_recent_turns(self, count: int = 6) -> List[Dict[str, Any]]:
         """
@@ -232,20 +315,61 @@ class SessionLog:
         Returns:
             List of turn dictionaries.
         """
-        recent = self.entries[-count:]
-        return [t.to_dict() for t in recent]
+        return [
+            {"timestamp": ts, "user": user, "ai": ai, "emotion": emotion}
+            for ts, user, ai, emotion in zip(
+                self._tail(self._timestamps, count),
+                self._tail(self._user_texts, count),
+                self._tail(self._ai_texts, count),
+                self._tail(self._emotions, count),
+            )
+        ]
 
     def __len__(self) -> int:
         """Return number of logged turns."""
-        return len(self.entries)
+        return len(self._emotions)
 
     def __bool__(self) -> bool:
         """Return True if session has entries."""
-        return len(self.entries) > 0
+        return len(self._emotions) > 0
 
 
 # ========== PROMPT BUILDERS ==========
 
+# Prompt text is joined once at import; each call is a single format() pass
+_FUSION_TEMPLATE = (
+    "CONTEXT: Short, solution-focused spoken therapy. "
+    "USER SAID: '{user_text}'. "
+    "EMOTIONAL STATE: '{emotion}'. "
+    "EMOTION TRAJECTORY: {trajectory}. "
+    "CONTRADICTION FLAG: {contradiction}. "
+    "SUGGESTED PLAYBOOK: {playbook}. "
+    "PACE HINT: {pace_hint}. "
+    "INSTRUCTION: "
+    "1) Validate based on words + emotion, "
+    "2) offer ONE specific tool right now, "
+    "3) keep under 3 sentences, "
+    "4) if contradiction, invite gentle clarification, "
+    "5) match the pace hint (slightly slower if requested)."
+)
+
+# Crisis safety net reply; the same text every time, so it's just a constant
+CRISIS_RESPONSE = (
+    "I hear you mentioning harm. Your safety matters. "
+    "If you are in danger, contact a local emergency number or a trusted person right now. "
+    "I can listen and help you plan one safe step."
+)
+
+_SUMMARY_TEMPLATE = (
+    "You are an AI therapist preparing a concise session handoff. "
+    "Summarize the session in 3 bullet points: "
+    "(1) observed emotions trend, (2) key concerns, (3) agreed small actions. "
+    "Keep it under 80 words. "
+    "Recent emotions: {emotion_timeline}. "
+    "Transcript snippets: {recent_turns}"
+)
+
+
 def build_fusion_prompt(
     user_text: str,
     emotion: str,
@@ -268,22 +392,14 @@ def build_fusion_prompt(
     Returns:
         str: The complete fusion prompt.
     """
-    prompt = (
-        "CONTEXT: Short, solution-focused spoken therapy. "
-        f"USER SAID: '{user_text}'. "
-        f"EMOTIONAL STATE: '{emotion}'. "
-        f"EMOTION TRAJECTORY: {trajectory}. "
-        f"CONTRADICTION FLAG: {contradiction}. "
-        f"SUGGESTED PLAYBOOK: {playbook}. "
-        f"PACE HINT: {pace_hint}. "
-        "INSTRUCTION: "
-        "1) Validate based on words + emotion, "
-        "2) offer ONE specific tool right now, "
-        "3) keep under 3 sentences, "
-        "4) if contradiction, invite gentle clarification, "
-        "5) match the pace hint (slightly slower if requested)."
+    return _FUSION_TEMPLATE.format(
+        user_text=user_text,
+        emotion=emotion,
+        trajectory=trajectory,
+        contradiction=contradiction,
+        playbook=playbook,
+        pace_hint=pace_hint,
     )
-    return prompt
 
 
 def build_summary_prompt(
@@ -300,33 +416,42 @@ def build_summary_prompt(
     Returns:
         str: The summary prompt for Gemini.
     """
-    prompt = (
-        "You are an AI therapist preparing a concise session handoff. "
-        "Summarize the session in 3 bullet points: "
-        "(1) observed emotions trend, (2) key concerns, (3) agreed small actions. "
-        "Keep it under 80 words. "
-        f"Recent emotions: {emotion_timeline}. "
-        f"Transcript snippets: {recent_turns}"
+    return _SUMMARY_TEMPLATE.format(
+        emotion_timeline=emotion_timeline,
+        recent_turns=recent_turns,
     )
-    return prompt
 
 
 def build_crisis_response() -> str:
     """
     Build the crisis safety net response.
 
+    Kept for existing callers; prefer CRISIS_RESPONSE directly.
+
     Returns:
         str: Crisis-forward message.
     """
-    return (
-        "I hear you mentioning harm. Your safety matters. "
-        "If you are in danger, contact a local emergency number or a trusted person right now. "
-        "I can listen and help you plan one safe step."
-    )
+    return CRISIS_RESPONSE
 
 
 # ========== TEXT PROCESSING ==========
 
+_SENTENCE_BREAK_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+def split_sentences(text: str) -> List[str]:
+    """
+    Split text into sentences on terminal punctuation.
+
+    Args:
+        text: Input text.
+
+    Returns:
+        List of non-empty sentences.
+    """
+    return [s for s in _SENTENCE_BREAK_RE.split(text.strip()) if s]
+
+
 def extract_word_count(text: str) -> int:
     """
     Extract word count from text (for pacing detection).
@@ -337,8 +462,8 @@ def extract_word_count(text: str) -> int:
     Returns:
         int: Number of words.
     """
-    import re
-    return len(re.findall(r"\w+", text))
+    # Whitespace split is plenty for a pacing threshold and skips the regex
+    return len(text.split())
 
 
 def determine_pace_hint(word_count: int, threshold: int = 18) -> str:
@@ -1,9 +1,119 @@
 # feelio-be/vision_module.py
+import time
+from collections import OrderedDict
+
 import cv2
-import mediapipe as mp
+import numpy as np
+
+try:
+    from numba import njit, prange
+except ImportError:  # numba is optional; the classifier just runs as plain Python
+    def njit(*args, **kwargs):
+        return lambda fn: fn
+    prange = range
+
+# --- 🎛️ TUNING SECTION (Adjust these if it's still wrong) ---
+SMILE_THRESHOLD = 0.015       # Lower = Easier to trigger Happy
+FROWN_THRESHOLD = -0.004      # Closer to 0 = Easier to trigger Sad
+SURPRISE_THRESHOLD = 0.05     # Lower = Easier to trigger Surprise
+SAD_BROW_THRESHOLD = 0.012    # Lower = Easier to trigger Sad Eyes
+
+# Frames are shrunk so their longer side is at most this before MediaPipe sees them.
+# Face mesh runs its detector at ~256px anyway, and the classifier only uses
+# normalized Y ratios, so the thresholds don't change with resolution.
+MAX_FRAME_SIDE = 256
+
+# A frame whose 8x8 average hash differs from the last analyzed frame of the same
+# stream in fewer than this many bits reuses that frame's emotion...
+HASH_MATCH_BITS = 5
+# ...unless that analysis is older than this. The hash is mostly background, so an
+# expression change on a still user can slip under the bit threshold.
+HASH_MAX_AGE = 1.0  # seconds
+MAX_TRACKED_STREAMS = 1024
+
+# Face-mesh landmarks the classifier reads, in _classify_emotion's argument order:
+# lips (upper, lower, left corner, right corner), then
+# eyebrows (left outer, left inner, right outer, right inner)
+LANDMARK_IDX = (13, 14, 61, 291, 55, 107, 285, 336)
+
+# Codes returned by _classify_emotion
+EMOTION_CODES = ("neutral", "surprise", "happy", "sad")
+
+# _classify_emotion packs its four threshold tests into a 4-bit index
+# (8 = mouth open, 4 = smile, 2 = frown, 1 = sad brows) and reads the code here.
+# Priority: surprise beats happy beats sad (frown or brows), else neutral.
+_EMOTION_TABLE = np.array(
+    [0, 3, 3, 3,   # 0-3: no smile or open mouth -> neutral, or sad if frown/brows
+     2, 2, 2, 2,   # 4-7: smile -> happy
+     1, 1, 1, 1,   # 8-15: mouth open -> surprise
+     1, 1, 1, 1],
+    dtype=np.int8,
+)
+
+
+@njit(cache=True, fastmath=True, nogil=True)
+def _classify_emotion(upper_lip, lower_lip, left_corner, right_corner,
+                      left_brow_outer, left_brow_inner, right_brow_outer, right_brow_inner):
+    """Landmark Y-coordinates -> index into EMOTION_CODES (compiled by numba when available)"""
+    # --- THE MATH (Geometry) ---
+
+    # 1. Mouth Openness
+    mouth_open_dist = lower_lip - upper_lip
+
+    # 2. Smile Ratio
+    # Positive (+) = Corners are lower than center (Smile)
+    # Negative (-) = Corners are higher than center (Frown)
+    mouth_center = (upper_lip + lower_lip) / 2
+    corners_avg = (left_corner + right_corner) / 2
+    smile_ratio = mouth_center - corners_avg
+
+    # 3. Brow Sadness
+    # In sadness, inner brows go UP (smaller Y value) relative to outer brows.
+    # We calculate (Outer Y - Inner Y).
+    # High Positive Value = Sad Brows
+    left_sad = left_brow_outer - left_brow_inner
+    right_sad = right_brow_outer - right_brow_inner
+    avg_sad_brow = (left_sad + right_sad) / 2
+
+    # --- DEBUG PRINT (Watch your terminal!) ---
+    # Uncomment the line below to see your face numbers in real-time
+    # print(f"Smile: {smile_ratio:.4f} | Brow: {avg_sad_brow:.4f}")
+
+    # --- CLASSIFICATION LOGIC ---
+    # Each test sets one bit; _EMOTION_TABLE resolves the priority, so there's
+    # no branch chain to mispredict on faces sitting near a threshold.
+    code = (
+        (mouth_open_dist > SURPRISE_THRESHOLD) * 8
+        | (smile_ratio > SMILE_THRESHOLD) * 4
+        | (smile_ratio < FROWN_THRESHOLD) * 2
+        | (avg_sad_brow > SAD_BROW_THRESHOLD) * 1
+    )
+    return _EMOTION_TABLE[code]
+
+
+@njit(cache=True, fastmath=True, nogil=True, parallel=True)
+def _classify_batch(ys):
+    """(N, 8) landmark Y-coordinates -> N indexes into EMOTION_CODES, rows spread across cores"""
+    out = np.empty(ys.shape[0], dtype=np.int8)
+    for i in prange(ys.shape[0]):
+        out[i] = _classify_emotion(ys[i, 0], ys[i, 1], ys[i, 2], ys[i, 3],
+                                   ys[i, 4], ys[i, 5], ys[i, 6], ys[i, 7])
+    return out
+
+
+def _average_hash(frame):
+    """64-bit perceptual hash: one bit per 8x8 cell, set where it's brighter than average"""
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    cells = cv2.resize(gray, (8, 8), interpolation=cv2.INTER_AREA)
+    if isinstance(cells, cv2.UMat):
+        cells = cells.get()
+    return int.from_bytes(np.packbits(cells > cells.mean()).tobytes(), "big")
+
 
 class VisionSystem:
-    def __init__(self):
+    def __init__(self, use_opencl=False):
+        import mediapipe as mp  # heavy; only load it once vision is actually set up
+
         self.mp_face_mesh = mp.solutions.face_mesh
         self.face_mesh = self.mp_face_mesh.FaceMesh(
             max_num_faces=1,
@@ -11,82 +121,142 @@ class VisionSystem:
             min_detection_confidence=0.5,
             min_tracking_confidence=0.5
         )
+        # stream -> (hash, emotion, analyzed_at) of its last analyzed frame, least recent first
+        self._last_seen = OrderedDict()
+        # MediaPipe runs its own thread pool; keep OpenCV from oversubscribing cores
+        cv2.setNumThreads(1)
+        # Optionally keep resize/hash/color conversion on the GPU (OpenCV T-API)
+        self.use_opencl = use_opencl and cv2.ocl.haveOpenCL()
+        if self.use_opencl:
+            cv2.ocl.setUseOpenCL(True)
+        elif use_opencl:
+            print("⚠️ OpenCL requested but not available in this OpenCV build; using CPU")
+        # Compile the classifiers now so the first real frame doesn't pay for it
+        _classify_emotion(0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0)
+        _classify_batch(np.zeros((1, len(LANDMARK_IDX))))
         print("✅ Vision System initialized with MediaPipe (Fast Mode)")
 
-    def analyze_frame(self, frame):
+    def analyze_frame(self, frame, stream=None):
         """
         Takes an OpenCV frame, runs geometry math, returns emotion string.
+
+        Frames from the same `stream` (e.g. a session id) that look almost the
+        same as the last analyzed one skip MediaPipe and reuse its emotion.
         """
         if frame is None:
             return "neutral"
 
-        # 1. Convert to RGB for MediaPipe
+        # 1. Shrink (less memory to shuffle for everything after this)
+        frame = self._shrink(frame)
+
+        # 2. A still user sends near-identical frames; don't rerun the face mesh
+        frame_hash = _average_hash(frame)
+        cached = self._cached_emotion(stream, frame_hash)
+        if cached is not None:
+            return cached
+
+        # 3. Face mesh + geometry math
+        ys = self._landmark_ys(frame)
+        detected_emotion = "neutral" if ys is None else EMOTION_CODES[_classify_emotion(*ys)]
+
+        self._remember(stream, frame_hash, detected_emotion)
+        return detected_emotion
+
+    def analyze_frames(self, frames, stream=None):
+        """
+        Analyze a burst of frames (e.g. catching up after a stall), oldest first.
+
+        Face mesh still runs one frame at a time, but all the landmarks are then
+        classified in a single parallel call. Returns one emotion string per frame.
+        """
+        emotions = ["neutral"] * len(frames)
+        ys = np.empty((len(frames), len(LANDMARK_IDX)), dtype=np.float64)
+        rows = []       # Which frame each filled row of `ys` came from
+        copies = []     # (frame, analyzed frame it matched); resolved after classifying
+        newest = None   # (hash, index, analyzed_at) of the newest frame run through face mesh
+
+        for i, frame in enumerate(frames):
+            if frame is None:
+                continue
+            frame = self._shrink(frame)
+            frame_hash = _average_hash(frame)
+
+            # Same rule as analyze_frame: compare against the last analyzed frame,
+            # which is the stream's stored one until this burst analyzes its own
+            if newest is None:
+                cached = self._cached_emotion(stream, frame_hash)
+                if cached is not None:
+                    emotions[i] = cached
+                    continue
+            elif ((newest[0] ^ frame_hash).bit_count() < HASH_MATCH_BITS
+                  and time.monotonic() - newest[2] <= HASH_MAX_AGE):
+                copies.append((i, newest[1]))
+                continue
+
+            newest = (frame_hash, i, time.monotonic())
+            face_ys = self._landmark_ys(frame)
+            if face_ys is not None:
+                ys[len(rows)] = face_ys
+                rows.append(i)
+
+        if rows:
+            for i, code in zip(rows, _classify_batch(ys[:len(rows)])):
+                emotions[i] = EMOTION_CODES[code]
+        for i, source in copies:
+            emotions[i] = emotions[source]
+        if newest is not None:
+            self._remember(stream, newest[0], emotions[newest[1]])
+        return emotions
+
+    def _shrink(self, frame):
+        """Downscale a BGR frame to MAX_FRAME_SIDE (as a UMat when using OpenCL)"""
+        height, width = frame.shape[:2]
+        if self.use_opencl:
+            frame = cv2.UMat(frame)  # Upload once; the steps after this run on the device
+        scale = MAX_FRAME_SIDE / max(height, width)
+        if scale < 1.0:
+            frame = cv2.resize(
+                frame,
+                (round(width * scale), round(height * scale)),
+                interpolation=cv2.INTER_AREA,
+            )
+        return frame
+
+    def _landmark_ys(self, frame):
+        """Run face mesh on a shrunk frame; returns the LANDMARK_IDX Y values, or None if no face"""
         rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        if self.use_opencl:
+            rgb_frame = rgb_frame.get()  # MediaPipe only takes numpy arrays
         results = self.face_mesh.process(rgb_frame)
-        
-        detected_emotion = "neutral"
-
-        if results.multi_face_landmarks:
-            for face_landmarks in results.multi_face_landmarks:
-                landmarks = face_landmarks.landmark
-                
-                # --- EXTRACT KEY POINTS (Y-coordinates) ---
-                # Lips
-                upper_lip = landmarks[13].y
-                lower_lip = landmarks[14].y
-                left_corner = landmarks[61].y
-                right_corner = landmarks[291].y
-                
-                # Eyebrows (Inner vs Outer)
-                left_brow_outer = landmarks[55].y
-                left_brow_inner = landmarks[107].y
-                right_brow_outer = landmarks[285].y
-                right_brow_inner = landmarks[336].y
-
-                # --- THE MATH (Geometry) ---
-                
-                # 1. Mouth Openness
-                mouth_open_dist = lower_lip - upper_lip
-                
-                # 2. Smile Ratio
-                # Positive (+) = Corners are lower than center (Smile)
-                # Negative (-) = Corners are higher than center (Frown)
-                mouth_center = (upper_lip + lower_lip) / 2
-                corners_avg = (left_corner + right_corner) / 2
-                smile_ratio = mouth_center - corners_avg
-
-                # 3. Brow Sadness
-                # In sadness, inner brows go UP (smaller Y value) relative to outer brows.
-                # We calculate (Outer Y - Inner Y).
-                # High Positive Value = Sad Brows
-                left_sad = left_brow_outer - left_brow_inner  
-                right_sad = right_brow_outer - right_brow_inner
-                avg_sad_brow = (left_sad + right_sad) / 2
-
-                # --- 🎛️ TUNING SECTION (Adjust these if it's still wrong) ---
-                SMILE_THRESHOLD = 0.015       # Lower = Easier to trigger Happy
-                FROWN_THRESHOLD = -0.004      # Closer to 0 = Easier to trigger Sad
-                SURPRISE_THRESHOLD = 0.05     # Lower = Easier to trigger Surprise
-                SAD_BROW_THRESHOLD = 0.012    # Lower = Easier to trigger Sad Eyes
-
-                # --- DEBUG PRINT (Watch your terminal!) ---
-                # Uncomment the line below to see your face numbers in real-time
-                # print(f"Smile: {smile_ratio:.4f} | Brow: {avg_sad_brow:.4f}")
-
-                # --- CLASSIFICATION LOGIC ---
-                if mouth_open_dist > SURPRISE_THRESHOLD:
-                    detected_emotion = "surprise"
-                
-                elif smile_ratio > SMILE_THRESHOLD: 
-                    detected_emotion = "happy"
-                
-                # Sadness: Check Frown OR Sad Brows
-                elif smile_ratio < FROWN_THRESHOLD: 
-                    detected_emotion = "sad"
-                elif avg_sad_brow > SAD_BROW_THRESHOLD:
-                    detected_emotion = "sad"
-                    
-                else:
-                    detected_emotion = "neutral"
-                    
-        return detected_emotion
\ No newline at end of file
+
+        if not results.multi_face_landmarks:
+            return None
+
+        # --- EXTRACT KEY POINTS (Y-coordinates) ---
+        # Only the 8 landmarks we need, gathered straight into one array
+        landmarks = results.multi_face_landmarks[-1].landmark
+        return np.fromiter(
+            (landmarks[i].y for i in LANDMARK_IDX),
+            dtype=np.float64,
+            count=len(LANDMARK_IDX),
+        )
+
+    def _cached_emotion(self, stream, frame_hash):
+        """The stream's last emotion if this frame looks the same and that result is still fresh"""
+        last = self._last_seen.get(stream)
+        if last is None:
+            return None
+        last_hash, emotion, analyzed_at = last
+        if (last_hash ^ frame_hash).bit_count() >= HASH_MATCH_BITS:
+            return None
+        if time.monotonic() - analyzed_at > HASH_MAX_AGE:
+            return None
+        self._last_seen.move_to_end(stream)
+        return emotion
+
+    def _remember(self, stream, frame_hash, emotion):
+        """Record a stream's last analyzed frame, dropping the least recent stream if full"""
+        self._last_seen[stream] = (frame_hash, emotion, time.monotonic())
+        self._last_seen.move_to_end(stream)
+        if len(self._last_seen) > MAX_TRACKED_STREAMS:
+            self._last_seen.popitem(last=False)